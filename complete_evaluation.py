@@ -1,13 +1,23 @@
 import argparse
+import contextlib
+import hashlib
+import io
 import os
 import json
+from collections import defaultdict
 import time
 import random
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from multiprocessing import shared_memory
 
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+import joblib
+from joblib import Parallel, delayed, parallel_backend
+from tqdm import tqdm
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedShuffleSplit
 
 from src.data import get_data_from_name
 from src.preprocess import get_preprocessed_data
@@ -17,128 +27,282 @@ from src.utils.metrics import all_classification_metrics_list
 from src.utils.plot import boxplot, plot_summary_roc_pr, plot_summary_roc, plot_summary_prc
 
 
+@contextlib.contextmanager
+def _tqdm_joblib(tqdm_object):
+    """Patch joblib so completed Parallel batches advance the given tqdm progress bar."""
+    class TqdmBatchCompletionCallback(joblib.parallel.BatchCompletionCallBack):
+        def __call__(self, *args, **kwargs):
+            tqdm_object.update(n=self.batch_size)
+            return super().__call__(*args, **kwargs)
+
+    old_batch_callback = joblib.parallel.BatchCompletionCallBack
+    joblib.parallel.BatchCompletionCallBack = TqdmBatchCompletionCallback
+    try:
+        yield tqdm_object
+    finally:
+        joblib.parallel.BatchCompletionCallBack = old_batch_callback
+        tqdm_object.close()
+
+
+def _run_single_label(label_col, X, Y, X_val, Y_val, base_model_grid, args, seed):
+    """Train and evaluate the full model grid for a single endpoint.
+
+    Returns (label_col, all_model_metrics, params_text), where params_text is the label's
+    block for best_parameters.txt.
+    """
+    # When labels run in parallel, X arrives as a shared-memory descriptor instead of a frame;
+    # rebuild a zero-copy DataFrame view on the shared buffer
+    shm = None
+    if isinstance(X, tuple):
+        shm_name, shape, columns, index = X
+        shm = shared_memory.SharedMemory(name=shm_name)
+        X = pd.DataFrame(np.ndarray(shape, dtype=np.float32, buffer=shm.buf), columns=columns, index=index)
+
+    try:
+        all_model_metrics, params_text = _evaluate_label(label_col, X, Y, X_val, Y_val, base_model_grid, args, seed)
+        return label_col, all_model_metrics, params_text
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+def _evaluate_label(label_col, X, Y, X_val, Y_val, base_model_grid, args, seed):
+    # Set endpoint for iteration
+    y = Y[label_col]
+
+    # If we do not have an external validation dataset, we split the original dataset.
+    # Splitting via index arrays keeps X/y views instead of allocating four new frames per label.
+    if not args.external_testset:
+        sss = StratifiedShuffleSplit(n_splits=1, test_size=args.test_fraction, random_state=seed)
+        train_idx, test_idx = next(sss.split(np.zeros(len(y)), y))
+        X_train = X.iloc[train_idx]
+        X_test = X.iloc[test_idx]
+        y_train = y.iloc[train_idx]
+        y_test = y.iloc[test_idx]
+    else:
+        # Set endpoint for iteration
+        y_val = Y_val[label_col]
+
+        # Set train and test
+        X_train = X
+        y_train = y
+        X_test = X_val
+        y_test = y_val
+
+    all_model_metrics = {}
+
+    # Clone the shared model grid so each label fits fresh, state-isolated estimators
+    model_grid = [(clone(model), param_grid) for model, param_grid in base_model_grid]
+    # When several labels run in parallel, keep the inner CV single-threaded to avoid oversubscription;
+    # inner_max_num_threads additionally caps BLAS/OpenMP threads inside the CV workers
+    inner_n_jobs = args.n_jobs_inner if args.n_jobs == 1 else 1
+    # Buffer the label's parameter log in memory; main appends the finished blocks sequentially,
+    # since concurrent workers writing the shared file directly would interleave across labels
+    params_f = io.StringIO()
+    params_f.write(f'=====\n{label_col}\n=====')
+    with parallel_backend('loky', n_jobs=inner_n_jobs, inner_max_num_threads=1):
+        for j, (model, param_grid) in enumerate(model_grid):
+            val_metrics, test_metrics, curves = evaluate_single_model(model, param_grid,
+                                                                      X_train, y_train, X_test, y_test,
+                                                                      cv_splits=args.cv_splits,
+                                                                      select_features=args.select_features,
+                                                                      shap_value_eval=args.shap_eval,
+                                                                      out_dir=args.out_dir,
+                                                                      sample_balancing=args.balancing_option,
+                                                                      seed=seed,
+                                                                      n_jobs=inner_n_jobs,
+                                                                      params_f=params_f,
+                                                                      search=args.search,
+                                                                      n_iter=args.n_iter)
+            all_model_metrics[str(model.__class__.__name__)] = (val_metrics, test_metrics, curves)
+
+    return all_model_metrics, params_f.getvalue()
+
+
 def main(args):
     # Setup output directory
     seed = args.seed
     np.random.seed(seed)
     random.seed(seed)
-    if args.out_dir is None:
-        feature_set_string = '' if args.feature_set is None else f'_{"_".join(args.feature_set)}'
-        args.out_dir = f'results_{args.dataset}{feature_set_string}_{str(datetime.now().strftime("%Y-%m-%dT%H-%M-%S"))}_seed_{seed}'
-    else:
-        feature_set_string = '' if args.feature_set is None else f'_{"_".join(args.feature_set)}'
-        args.out_dir = f'{args.out_dir}/results_{args.dataset}{feature_set_string}_{str(datetime.now().strftime("%Y-%m-%dT%H-%M-%S"))}_seed_{seed}'
+    feature_set_string = '' if args.feature_set is None else f'_{"_".join(args.feature_set)}'
+    timestamp = datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+    run_dir = f'results_{args.dataset}{feature_set_string}_{timestamp}_seed_{seed}'
+    args.out_dir = run_dir if args.out_dir is None else f'{args.out_dir}/{run_dir}'
 
     os.makedirs(f'{args.out_dir}', exist_ok=True)
     os.makedirs(f'{args.out_dir}/data_frames', exist_ok=True)
 
-    # Get DataInformation object for the specified task
-    data = get_data_from_name(args.dataset)
+    # Cache preprocessed data on disk keyed by a hash of all parsing/preprocessing arguments,
+    # so reruns with new models or seeds skip parsing and imputation entirely
+    cache_key = None
+    if args.cache_dir is not None:
+        preproc_args = {key: vars(args)[key] for key in ['dataset', 'feature_set', 'drop_features', 'drop_missing_value',
+                                                         'external_testset', 'feature_selectors', 'missing_threshold',
+                                                         'correlation_threshold', 'imputer', 'normaliser']}
+        cache_key = hashlib.sha1(json.dumps(preproc_args, sort_keys=True).encode()).hexdigest()
+        os.makedirs(args.cache_dir, exist_ok=True)
 
-    # Parse data
-    data.parse(drop_columns=args.drop_features, feature_set=args.feature_set, drop_missing_value=args.drop_missing_value,
-               out_dir=args.out_dir, exploration=args.data_exploration, external_validation=args.external_testset)
+    if cache_key is not None and os.path.exists(f'{args.cache_dir}/{cache_key}_X.parquet'):
+        print(f'Loading preprocessed data from cache {args.cache_dir}/{cache_key}_*.parquet')
+        X = pd.read_parquet(f'{args.cache_dir}/{cache_key}_X.parquet')
+        Y = pd.read_parquet(f'{args.cache_dir}/{cache_key}_Y.parquet')
+        if args.external_testset:
+            X_val = pd.read_parquet(f'{args.cache_dir}/{cache_key}_X_val.parquet')
+            Y_val = pd.read_parquet(f'{args.cache_dir}/{cache_key}_Y_val.parquet')
+        if args.data_exploration:
+            # The exploration report is a parse-time artifact the cache skips, so parse anyway
+            data = get_data_from_name(args.dataset)
+            data.parse(drop_columns=args.drop_features, feature_set=args.feature_set,
+                       drop_missing_value=args.drop_missing_value, out_dir=args.out_dir,
+                       exploration=True, external_validation=args.external_testset)
+    else:
+        # Get DataInformation object for the specified task
+        data = get_data_from_name(args.dataset)
+
+        # Parse data
+        data.parse(drop_columns=args.drop_features, feature_set=args.feature_set, drop_missing_value=args.drop_missing_value,
+                   out_dir=args.out_dir, exploration=args.data_exploration, external_validation=args.external_testset)
 
-    # Preprocess data
-    X, Y = get_preprocessed_data(data,
-                                 fs_operations=args.feature_selectors,
-                                 missing_threshold=args.missing_threshold,
-                                 correlation_threshold=args.correlation_threshold,
-                                 imputer=args.imputer,
-                                 normaliser=args.normaliser,
-                                 verbose=True,
-                                 validation=False)
+        # Preprocess data
+        X, Y = get_preprocessed_data(data,
+                                     fs_operations=args.feature_selectors,
+                                     missing_threshold=args.missing_threshold,
+                                     correlation_threshold=args.correlation_threshold,
+                                     imputer=args.imputer,
+                                     normaliser=args.normaliser,
+                                     verbose=True,
+                                     validation=False)
 
-    # Preprocess external validation data
+        # Preprocess external validation data
+        if args.external_testset:
+            X_val, Y_val = get_preprocessed_data(data,
+                                                 fs_operations=args.feature_selectors,
+                                                 missing_threshold=args.missing_threshold,
+                                                 correlation_threshold=args.correlation_threshold,
+                                                 imputer=args.imputer,
+                                                 normaliser=args.normaliser,
+                                                 verbose=True, validation=True)
+            extra_cols = X_val.columns.difference(X.columns)
+            missing_cols = X.columns.difference(X_val.columns)
+            print(f'Dropping columns in val data since they are missing in train data: {extra_cols.tolist()}')
+            # Get rid of extra columns introduced by values in validation dataset
+            X_val = X_val.drop(columns=extra_cols)
+            assert missing_cols.empty, f'Error: Train data includes columns {missing_cols.tolist()} that are missing in val data'
+
+        if cache_key is not None:
+            X.to_parquet(f'{args.cache_dir}/{cache_key}_X.parquet')
+            Y.to_parquet(f'{args.cache_dir}/{cache_key}_Y.parquet')
+            if args.external_testset:
+                X_val.to_parquet(f'{args.cache_dir}/{cache_key}_X_val.parquet')
+                Y_val.to_parquet(f'{args.cache_dir}/{cache_key}_Y_val.parquet')
+    # Downcast once up-front: float32 halves the memory traffic of every CV fit and of the
+    # memmaps shared with label workers, and the sklearn estimators used here accept it natively
+    num_cols = X.select_dtypes(include='number').columns
+    X[num_cols] = X[num_cols].astype(np.float32)
+    Y = Y.astype(np.int8)
     if args.external_testset:
-        X_val, Y_val = get_preprocessed_data(data,
-                                             fs_operations=args.feature_selectors,
-                                             missing_threshold=args.missing_threshold,
-                                             correlation_threshold=args.correlation_threshold,
-                                             imputer=args.imputer,
-                                             normaliser=args.normaliser,
-                                             verbose=True, validation=True)
-        print(f'Dropping columns in val data since they are missing in train data: {X_val.columns.difference(X.columns)}')
-        # Get rid of extra columns introduced by values in validation dataset
-        X_val = X_val.drop(set(X_val.columns.difference(X.columns)), axis=1)
-        assert len(X.columns.difference(X_val.columns)) == 0, f'Error: Train data includes columns {X.columns.difference(X_val.columns)} that are missing in val data'
-    all_metrics_list = all_classification_metrics_list
-
-    all_test_metric_dfs = {metric: pd.DataFrame(dtype=np.float64) for metric in all_metrics_list if metric != 'confusion_matrix'}
+        num_cols_val = X_val.select_dtypes(include='number').columns
+        X_val[num_cols_val] = X_val[num_cols_val].astype(np.float32)
+        Y_val = Y_val.astype(np.int8)
 
     with open(f'{args.out_dir}/best_parameters.txt', 'a+') as f:
         f.write(f'\n========== New Trial at {time.strftime("%d.%m.%Y %H:%M:%S")} ==========\n')
-        f.write(str(vars(args)))
-        f.write('\n')
+    # Machine-readable run configuration instead of a dict repr in best_parameters.txt
+    with open(f'{args.out_dir}/run_config.json', 'w') as fh:
+        json.dump(vars(args), fh, default=str, indent=2)
 
-    for k, label_col in enumerate(Y.columns):
-        print(f'Predicting {label_col}')
-        with open(f'{args.out_dir}/best_parameters.txt', 'a+') as f:
-            f.write(f'=====\n{label_col}\n=====')
+    if not args.external_testset:
+        X_val = Y_val = None
 
-        # Set endpoint for iteration
-        y = Y[label_col]
+    # model grid, built once since its arguments do not change across labels
+    base_model_grid = get_classification_model_grid('balanced' if args.balancing_option == 'class_weight' else None,
+                                                    seed=args.seed)
 
-        # If we do not have an external validation dataset, we split the original dataset
-        if not args.external_testset:
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_fraction,
-                                                                random_state=seed, shuffle=True, stratify=y)
-        else:
-            # Set endpoint for iteration
-            y_val = Y_val[label_col]
+    # With parallel labels, place the feature matrix in shared memory once and hand the workers a
+    # descriptor; each worker maps a zero-copy view instead of receiving a pickled copy
+    shm = None
+    if args.n_jobs != 1:
+        X_values = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+        shm = shared_memory.SharedMemory(create=True, size=X_values.nbytes)
+        np.ndarray(X_values.shape, dtype=np.float32, buffer=shm.buf)[:] = X_values
+        X_ref = (shm.name, X_values.shape, X.columns, X.index)
+    else:
+        X_ref = X
 
-            # Set train and test
-            X_train = X
-            y_train = y
-            X_test = X_val
-            y_test = y_val
+    try:
+        # Train the model grid for each label in parallel; plotting and CSV writes stay sequential below
+        with _tqdm_joblib(tqdm(total=len(Y.columns), desc='Labels')):
+            results = Parallel(n_jobs=args.n_jobs, backend='loky', max_nbytes='1G')(
+                delayed(_run_single_label)(label_col, X_ref, Y, X_val, Y_val, base_model_grid, args, seed) for label_col in Y.columns)
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
 
-        all_model_metrics = {}
+    # Append each label's buffered parameter block in label order
+    with open(f'{args.out_dir}/best_parameters.txt', 'a') as params_f:
+        for _, _, params_text in results:
+            params_f.write(params_text)
 
-        # model grid
-        model_grid = get_classification_model_grid('balanced' if args.balancing_option == 'class_weight' else None,
-                                                   seed=args.seed)
-        for j, (model, param_grid) in enumerate(model_grid):
-            val_metrics, test_metrics, curves = evaluate_single_model(model, param_grid,
-                                                                      X_train, y_train, X_test, y_test,
-                                                                      cv_splits=args.cv_splits,
-                                                                      select_features=args.select_features,
-                                                                      shap_value_eval=args.shap_eval,
-                                                                      out_dir=args.out_dir,
-                                                                      sample_balancing=args.balancing_option,
-                                                                      seed=seed)
-            all_model_metrics[str(model.__class__.__name__)] = (val_metrics, test_metrics, curves)
+    # Summary plots render in background processes so aggregation of the next label is not blocked on savefig
+    plot_pool = ProcessPoolExecutor(max_workers=2)
+    plot_futures = []
+
+    # The confusion matrix is handled separately everywhere below, so filter it out once
+    numeric_metrics = [metric for metric in all_classification_metrics_list if metric != 'confusion_matrix']
+
+    # Test metrics are collected in one preallocated (metric, model, label) array with O(1) stores
+    # and wrapped in DataFrames only once for the final writes
+    model_names = [str(model.__class__.__name__) for model, _ in base_model_grid]
+    metric_idx = {metric: i for i, metric in enumerate(numeric_metrics)}
+    model_idx = {model_name: i for i, model_name in enumerate(model_names)}
+    label_idx = {label_col: i for i, label_col in enumerate(Y.columns)}
+    test_mat = np.full((len(numeric_metrics), len(model_names), len(Y.columns)), np.nan, dtype=np.float32)
+
+    for label_col, all_model_metrics, _ in results:
+        y = Y[label_col]
 
         # ===== Save aggregate plots across models =====
+        # Build {metric: {model: (val, test)}} in a single pass over the models
+        json_metric_data = defaultdict(dict)
+        for model_name, (val_metrics, test_metrics, _) in all_model_metrics.items():
+            for metric_name, val_values in val_metrics.items():
+                if metric_name == 'confusion_matrix':
+                    json_metric_data[metric_name][model_name] = ([cv_cm.tolist() for cv_cm in val_values],
+                                                                 test_metrics[metric_name].tolist())
+                else:
+                    json_metric_data[metric_name][model_name] = (val_values, test_metrics[metric_name])
+
         # Generate Boxplots for Metrics
-        json_metric_data = {}
-        for metric_name in all_model_metrics[str(model.__class__.__name__)][0].keys():
-            if metric_name == 'confusion_matrix':
-                json_metric_data[metric_name] = {model_name: ([cv_cm.tolist() for cv_cm in val_metrics[metric_name]], test_metrics[metric_name].tolist())
-                                                 for model_name, (val_metrics, test_metrics, _) in all_model_metrics.items()}
-                continue
-            metric_data = {model_name: (val_metrics[metric_name], test_metrics[metric_name])
-                           for model_name, (val_metrics, test_metrics, _) in all_model_metrics.items()}
-            json_metric_data[metric_name] = metric_data
-            boxplot(args.out_dir, metric_data, metric_name, label_col, ymin=(-1 if metric_name == 'mcc' else 0))
-        json.dump(json_metric_data, open(f'{args.out_dir}/{label_col}/all_model_metrics.json', 'w'), indent=4)
+        for metric_name in numeric_metrics:
+            boxplot(args.out_dir, json_metric_data[metric_name], metric_name, label_col, ymin=(-1 if metric_name == 'mcc' else 0))
+        with open(f'{args.out_dir}/{label_col}/all_model_metrics.json', 'w') as fh:
+            json.dump(json_metric_data, fh, default=float)
 
         # Plot roc pr for all models
-        plot_summary_roc(all_model_metrics, args.out_dir, label_col, dataset_partition='val', legend=True, value_in_legend=False)
-        plot_summary_roc(all_model_metrics, args.out_dir, label_col, dataset_partition='test', legend=True, value_in_legend=False)
-        plot_summary_prc(all_model_metrics, args.out_dir, label_col, y, dataset_partition='val', legend=True, value_in_legend=False)
-        plot_summary_prc(all_model_metrics, args.out_dir, label_col, y, dataset_partition='test', legend=True, value_in_legend=False)
-        plot_summary_roc_pr(all_model_metrics, args.out_dir, label_col, y)
-
-        # save results in DF
-        for model_name, test_data in {model_name: entry[1] for model_name, entry in all_model_metrics.items()}.items():
-            for metric, value in test_data.items():
-                if metric == 'confusion_matrix':
-                    continue
-                all_test_metric_dfs[metric].loc[model_name, label_col.replace(' ', '_')] = value
-
-        for metric, df in all_test_metric_dfs.items():
+        plot_futures.append(plot_pool.submit(plot_summary_roc, all_model_metrics, args.out_dir, label_col, dataset_partition='val', legend=True, value_in_legend=False))
+        plot_futures.append(plot_pool.submit(plot_summary_roc, all_model_metrics, args.out_dir, label_col, dataset_partition='test', legend=True, value_in_legend=False))
+        plot_futures.append(plot_pool.submit(plot_summary_prc, all_model_metrics, args.out_dir, label_col, y, dataset_partition='val', legend=True, value_in_legend=False))
+        plot_futures.append(plot_pool.submit(plot_summary_prc, all_model_metrics, args.out_dir, label_col, y, dataset_partition='test', legend=True, value_in_legend=False))
+        plot_futures.append(plot_pool.submit(plot_summary_roc_pr, all_model_metrics, args.out_dir, label_col, y))
+
+        # save results
+        for model_name, (_, test_data, _) in all_model_metrics.items():
+            for metric in numeric_metrics:
+                test_mat[metric_idx[metric], model_idx[model_name], label_idx[label_col]] = test_data[metric]
+
+    label_names = [label_col.replace(' ', '_') for label_col in Y.columns]
+    for i, metric in enumerate(numeric_metrics):
+        df = pd.DataFrame(test_mat[i], index=model_names, columns=label_names)
+        if args.legacy_csv:
             df.to_csv(f'{args.out_dir}/data_frames/{metric}.csv')
+        else:
+            df.to_parquet(f'{args.out_dir}/data_frames/{metric}.parquet', engine='pyarrow', compression='zstd')
+
+    # Wait for all pending summary plots before exiting; .result() re-raises any worker error
+    for future in plot_futures:
+        future.result()
+    plot_pool.shutdown(wait=True)
 
 
 def get_parser():
@@ -181,6 +345,18 @@ def get_parser():
                         help='Threshold for dropping columns with high correlation')
     parser.add_argument('--data_exploration', '-ex', action='store_true',
                         help='if true, an html file will be generated showing statistics of the parsed dataset')
+    parser.add_argument('--search', type=str, default='grid', choices=['grid', 'random'],
+                        help='hyperparameter search strategy; random samples --n_iter configurations instead of the full grid')
+    parser.add_argument('--n_iter', type=int, default=60,
+                        help='number of sampled configurations per model for --search random')
+    parser.add_argument('--cache_dir', '-c', type=str, default=None,
+                        help='if given, preprocessed data is cached as parquet in this directory and reused on reruns')
+    parser.add_argument('--legacy_csv', action='store_true',
+                        help='write the aggregated metric frames as CSV instead of parquet')
+    parser.add_argument('--n_jobs', '-j', type=int, default=1,
+                        help='number of labels to evaluate in parallel; -1 uses all cores')
+    parser.add_argument('--n_jobs_inner', '-ji', type=int, default=-1,
+                        help='number of cores for the CV grid search per model; forced to 1 when --n_jobs != 1')
     parser.add_argument('--seed', '-s', type=int, default=42,
                         help='If true, a seed will be set for reproducibility')
 
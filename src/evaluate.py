@@ -5,7 +5,7 @@ import numpy as np
 from imblearn.over_sampling import SMOTE, ADASYN, RandomOverSampler
 from sklearn.feature_selection import SelectFromModel, SelectKBest
 from sklearn.metrics import ConfusionMatrixDisplay, auc, plot_precision_recall_curve, plot_roc_curve
-from sklearn.model_selection import GridSearchCV, LeaveOneOut, StratifiedKFold
+from sklearn.model_selection import GridSearchCV, LeaveOneOut, RandomizedSearchCV, StratifiedKFold
 from imblearn.pipeline import Pipeline
 from sklearn.svm import LinearSVC
 from src.test import test_classification_model
@@ -16,7 +16,8 @@ from src.utils.plot import plot_val_mean_prec_rec, plot_val_mean_roc, plot_confu
 def evaluate_single_model(model, param_grid,
                           X_train, y_train, X_test, y_test,
                           cv_splits=8, cv_scoring='average_precision', select_features=True, shap_value_eval=False,
-                          cm_agg_type='sum', out_dir='results/default', sample_balancing=None, seed=42):
+                          cm_agg_type='sum', out_dir='results/default', sample_balancing=None, seed=42, n_jobs=-1,
+                          params_f=None, search='grid', n_iter=60):
     os.makedirs(f'{out_dir}/{y_train.name.replace(" ", "_")}/val/', exist_ok=True)
     os.makedirs(f'{out_dir}/{y_train.name.replace(" ", "_")}/test/', exist_ok=True)
     model_name = str(model.__class__.__name__)
@@ -78,7 +79,12 @@ def evaluate_single_model(model, param_grid,
     # Default CV scoring
     if cv_scoring is None:
         cv_scoring = "average_precision"
-    grid_model = GridSearchCV(pipeline, param_grid=param_grid, scoring=cv_scoring, verbose=False, cv=cv, n_jobs=-1, error_score=0)
+    if search == 'random':
+        # Sample n_iter configurations instead of enumerating the full Cartesian product
+        grid_model = RandomizedSearchCV(pipeline, param_distributions=param_grid, n_iter=n_iter, scoring=cv_scoring,
+                                        verbose=False, cv=cv, n_jobs=n_jobs, random_state=seed, error_score=0)
+    else:
+        grid_model = GridSearchCV(pipeline, param_grid=param_grid, scoring=cv_scoring, verbose=False, cv=cv, n_jobs=n_jobs, error_score=0)
     grid_model.fit(X_train, y_train)
     try:
         pass
@@ -92,9 +98,13 @@ def evaluate_single_model(model, param_grid,
         return {metric: ([0.0] if metric != 'confusion_matrix' else [empty_cm] * cv_splits) for metric in all_metrics_list}, \
                {metric: (0.0 if metric != 'confusion_matrix' else empty_cm) for metric in all_metrics_list}, \
                (([0] * 101, [0] * 101, [0] * 101), ([0] * 101, [0] * 101, [0] * 101))
-    with open(f'{out_dir}/best_parameters.txt', 'a+') as f:
-        f.write('\n' + model_name)
-        f.write(f'\nBest Params: {grid_model.best_params_}\n')
+    if params_f is not None:
+        params_f.write('\n' + model_name)
+        params_f.write(f'\nBest Params: {grid_model.best_params_}\n')
+    else:
+        with open(f'{out_dir}/best_parameters.txt', 'a+') as f:
+            f.write('\n' + model_name)
+            f.write(f'\nBest Params: {grid_model.best_params_}\n')
     print(f'Best Params: {grid_model.best_params_} - {cv_scoring}: {grid_model.best_score_}')
     best_model = grid_model.best_estimator_
 
@@ -185,5 +195,5 @@ def evaluate_single_model(model, param_grid,
 
     # =================== Final Model Testing ===============
     test_metrics, test_curves = test_classification_model(best_model, X_train, y_train, X_test, y_test,
-                                                          model_name, select_features, out_dir)
+                                                          model_name, select_features, out_dir, params_f=params_f)
     return cv_metrics, test_metrics, ((mean_tpr, overall_precision, overall_recall), test_curves)
@@ -10,7 +10,8 @@ from src.utils.metrics import compute_classification_metrics
 from src.utils.plot import plot_coefficients, plot_roc_pr_curve, plot_confusion_matrix, plot_calibration_curves
 
 
-def test_classification_model(model, X_train, y_train, X_test, y_test, model_name, select_features, out_dir):
+def test_classification_model(model, X_train, y_train, X_test, y_test, model_name, select_features, out_dir,
+                              params_f=None):
     # Re-fit complete training set
     model.fit(X_train, y_train)
 
@@ -24,8 +25,11 @@ def test_classification_model(model, X_train, y_train, X_test, y_test, model_nam
     ix = np.argmax(scores)
     optimal_threshold = thresholds[ix]
     optimal_f1 = scores[ix]
-    with open(f'{out_dir}/best_parameters.txt', 'a+') as f:
-        f.write(f'optimal classification threshold: {optimal_threshold} with F1-Score {optimal_f1}\n\n')
+    if params_f is not None:
+        params_f.write(f'optimal classification threshold: {optimal_threshold} with F1-Score {optimal_f1}\n\n')
+    else:
+        with open(f'{out_dir}/best_parameters.txt', 'a+') as f:
+            f.write(f'optimal classification threshold: {optimal_threshold} with F1-Score {optimal_f1}\n\n')
     test_metrics = compute_classification_metrics(y_test, to_labels(y_probas, optimal_threshold))
 
     # ==== ROC & AUPRC ====
@@ -44,8 +48,11 @@ def test_classification_model(model, X_train, y_train, X_test, y_test, model_nam
     feature_importances = get_feature_importance(model)
     if select_features:
         feature_names = X_train.columns[model.named_steps['selector'].get_support()]
-        with open(f'{out_dir}/best_parameters.txt', 'a+') as f:
-            f.write(f'selected features: {feature_names}\n')
+        if params_f is not None:
+            params_f.write(f'selected features: {feature_names}\n')
+        else:
+            with open(f'{out_dir}/best_parameters.txt', 'a+') as f:
+                f.write(f'selected features: {feature_names}\n')
         print(f'Selected features: {feature_names}')
     else:
         feature_names = X_train.columns
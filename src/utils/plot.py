@@ -1,3 +1,6 @@
+import matplotlib
+# Non-interactive backend: figures are only ever written to disk, and Agg is safe in worker processes
+matplotlib.use('Agg')
 import numpy as np
 import seaborn as sns
 import shap
@@ -139,8 +142,8 @@ def plot_summary_roc(all_model_metrics, out_dir, label_col, dataset_partition='v
     plt.ylabel('True Positive Rate', fontsize=18)
     ax.tick_params(axis='both', which='major', labelsize=12)
     ax.tick_params(axis='both', which='minor', labelsize=12)
-    plt.savefig(f'{out_dir}/{label_col}/all_models_{dataset_partition}_roc_curves'.replace(' ', '_'),
-                bbox_inches='tight', dpi=dpi)
+    fig.tight_layout()
+    plt.savefig(f'{out_dir}/{label_col}/all_models_{dataset_partition}_roc_curves'.replace(' ', '_'), dpi=dpi)
     plt.close()
 
 
@@ -192,8 +195,8 @@ def plot_summary_prc(all_model_metrics, out_dir, label_col, y, dataset_partition
     ax.tick_params(axis='both', which='minor', labelsize=12)
     if legend:
         ax.legend(loc="upper center", bbox_to_anchor=(0.5, -0.15))
-    plt.savefig(f'{out_dir}/{label_col}/all_models_{dataset_partition}_prc_curves'.replace(' ', '_'),
-                bbox_inches='tight', dpi=dpi)
+    fig.tight_layout()
+    plt.savefig(f'{out_dir}/{label_col}/all_models_{dataset_partition}_prc_curves'.replace(' ', '_'), dpi=dpi)
     plt.close()
 
 
@@ -235,8 +238,8 @@ def plot_summary_roc_pr(all_model_metrics, out_dir, label_col, y):
     ax2.set(xlim=[-0.05, 1.05], ylim=[0.0, 1.05],
             title='Precision-Recall')
     ax2.legend(loc="upper center", bbox_to_anchor=(0.5, -0.15))
-    plt.savefig(f'{out_dir}/{label_col}/all_models_roc_prc_curves'.replace(' ', '_'),
-                bbox_inches='tight', dpi=dpi)
+    fig.tight_layout()
+    plt.savefig(f'{out_dir}/{label_col}/all_models_roc_prc_curves'.replace(' ', '_'), dpi=dpi)
     plt.close()
 
 